@@ -1,36 +1,154 @@
 # manage_db.py
 from __future__ import annotations
 import argparse
-from rag_ingest import load_documents, split_documents, attach_chunk_ids
-from rag_db import init_db, update_db, stats_db
+import os
+from typing import Set
+from app.RAG.rag_config import PDF_DIR, UPLOAD_SOURCE_PREFIX, DEDUP_INDEX_PATH, QINDEX_PATH
+from app.RAG.rag_ingest import load_documents, split_documents, attach_chunk_ids, group_by_source
+from app.RAG.rag_db import (
+    init_db, stats_db, get_db, source_version, replace_source,
+    delete_source, list_sources, compact_db,
+)
+from app.RAG.rag_dedup import SimHashIndex, drop_near_duplicates
+from app.RAG.rag_qindex import QuestionIndex
+from app.RAG.rag_lock import store_lock
 
 def cmd_init():
     docs = load_documents()
     chunks = split_documents(docs)
-    chunks_with_ids, ids = attach_chunk_ids(chunks)
-    added = init_db(chunks_with_ids, ids)
+    chunks_with_ids, _ = attach_chunk_ids(chunks)
+    for group in group_by_source(chunks_with_ids).values():
+        version = source_version(group)
+        for ch in group:
+            ch.metadata["version"] = version
+    with store_lock():
+        index = SimHashIndex.load(DEDUP_INDEX_PATH)
+        unique_chunks, skipped = drop_near_duplicates(chunks_with_ids, index)
+        added = init_db(unique_chunks, [c.metadata["id"] for c in unique_chunks])
+        index.save()
+        qindex = QuestionIndex.load(QINDEX_PATH)
+        for source, group in group_by_source(chunks_with_ids).items():
+            qindex.set_source(source, group, index.links)
+        qindex.save()
     print(f"[INIT] Added {added} chunks.")
+    if skipped:
+        print(f"[INIT] Skipped {skipped} near-duplicate chunks (embeddings saved).")
 
 def cmd_update():
     docs = load_documents()
     chunks = split_documents(docs)
     chunks_with_ids, _ = attach_chunk_ids(chunks)
-    added = update_db(chunks_with_ids)
-    if added == 0:
+    added = removed = skipped = promoted = orphaned = 0
+    for source, group in group_by_source(chunks_with_ids).items():
+        result = replace_source(source, group)
+        added += result["added"]
+        removed += result["removed"]
+        skipped += result["embeddings_saved"]
+        promoted += result["promoted"]
+        orphaned += result["orphaned"]
+    if added == 0 and removed == 0:
         print("[UPDATE] No new chunks.")
     else:
-        print(f"[UPDATE] Added {added} new chunks.")
+        print(f"[UPDATE] Added {added} new chunks, removed {removed} stale chunks.")
+    if skipped:
+        print(f"[UPDATE] Skipped {skipped} near-duplicate chunks (embeddings saved).")
+    if promoted:
+        print(f"[UPDATE] Embedded {promoted} near-duplicate chunks of other sources that matched replaced text.")
+    if orphaned:
+        print(f"[UPDATE] {orphaned} near-duplicate chunks from before duplicate text was kept were lost.")
+
+def cmd_rebuild(workers: int, fresh: bool, allow_drop: bool):
+    from app.RAG.rag_rebuild import rebuild_db  # pulls in multiprocessing; only needed here
+    total, embedded, skipped, carried = rebuild_db(workers=workers, fresh=fresh, allow_drop=allow_drop)
+    print(f"[REBUILD] Swapped in new DB with {total + carried} chunks "
+          f"({embedded} embedded this run, {carried} carried over from uploads).")
+    if skipped:
+        print(f"[REBUILD] Skipped {skipped} near-duplicate chunks (embeddings saved).")
 
 def cmd_stats():
     total = stats_db()
     print(f"[STATS] Total chunks in DB: {total}")
 
+def cmd_delete(source: str):
+    deleted, promoted, lost = delete_source(source)
+    print(f"[DELETE] Removed {deleted} chunks for {source!r}.")
+    if promoted:
+        print(f"[DELETE] Embedded {promoted} near-duplicate chunks of other sources that pointed here.")
+    if lost:
+        print(f"[DELETE] {lost} near-duplicate chunks from before duplicate text was kept were lost.")
+
+def referenced_sources() -> Set[str]:
+    """
+    Non-upload sources still backed by something: a `files` row's path or a
+    PDF that still exists in PDF_DIR.
+    """
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session
+    from app.models import File
+
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        raise SystemExit("[GC] DATABASE_URL is not set.")
+
+    keep: Set[str] = set()
+    engine = create_engine(url)
+    with Session(engine) as session:
+        for (path,) in session.execute(select(File.path)):
+            keep.add(path)
+    keep.update(str(p) for p in PDF_DIR.glob("*.pdf"))
+    return keep
+
+def cmd_gc(apply: bool = False):
+    db = get_db()
+    sources = list_sources(db)
+    # /upload does not create `files` rows, so uploads can't be reconciled
+    # against them: leave them to `delete --source`
+    uploads = {s for s in sources if s.startswith(UPLOAD_SOURCE_PREFIX)}
+    orphans = sorted(sources - uploads - referenced_sources())
+    if uploads:
+        print(f"[GC] Leaving {len(uploads)} upload sources alone (not tracked in `files`).")
+    if not orphans:
+        print("[GC] Nothing to collect.")
+        return
+    for source in orphans:
+        if not apply:
+            print(f"[GC] Would delete {source!r}")
+            continue
+        deleted, _, _ = delete_source(source, db)
+        print(f"[GC] Deleted {deleted} chunks for {source!r}")
+
+def cmd_compact():
+    copied, before, after = compact_db()
+    print(f"[COMPACT] Rebuilt store with {copied} chunks: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB.")
+
+def positive_int(value: str) -> int:
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {n}")
+    return n
+
 def main():
     p = argparse.ArgumentParser("Manage Chroma PDF RAG DB")
     sub = p.add_subparsers(dest="cmd", required=True)
     sub.add_parser("init")
     sub.add_parser("update")
     sub.add_parser("stats")
+    p_rebuild = sub.add_parser("rebuild")
+    p_rebuild.add_argument("--workers", type=positive_int, default=4,
+                           help="PDF parser processes and concurrent embedding requests")
+    p_rebuild.add_argument("--fresh", action="store_true", help="ignore any checkpoint from an interrupted run")
+    p_rebuild.add_argument("--allow-drop", action="store_true",
+                           help="swap even if live non-upload sources are missing from PDF_DIR")
+    p_delete = sub.add_parser("delete")
+    p_delete.add_argument("--source", required=True, help='e.g. "upload:hw1.pdf" or a PDF path')
+    p_gc = sub.add_parser(
+        "gc",
+        help="drop PDF sources not backed by a `files` row or a PDF in PDF_DIR (dry run unless --apply)",
+        description="Only non-upload sources are collected; upload:<filename> sources are never "
+                    "touched by gc (remove them with `delete --source`).",
+    )
+    p_gc.add_argument("--apply", action="store_true", help="actually delete (default: only list)")
+    sub.add_parser("compact")
     args = p.parse_args()
 
     if args.cmd == "init":
@@ -39,6 +157,14 @@ def main():
         cmd_update()
     elif args.cmd == "stats":
         cmd_stats()
+    elif args.cmd == "rebuild":
+        cmd_rebuild(args.workers, args.fresh, args.allow_drop)
+    elif args.cmd == "delete":
+        cmd_delete(args.source)
+    elif args.cmd == "gc":
+        cmd_gc(args.apply)
+    elif args.cmd == "compact":
+        cmd_compact()
 
 if __name__ == "__main__":
     main()
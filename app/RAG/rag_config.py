@@ -3,6 +3,10 @@ from pathlib import Path
 
 PDF_DIR = Path("/Users/deon/Documents/Models/Icarus-API/app/RAG/data")
 DB_DIR  = Path("/Users/deon/Documents/Models/Icarus-API/app/RAG/chroma_langchain_db")
+COLLECTION_NAME = "langchain"   # langchain_chroma's default, which existing stores use
+
+# sources ingested through /upload; their PDFs are not kept on disk
+UPLOAD_SOURCE_PREFIX = "upload:"
 
 # your ollama models
 EMBED_MODEL = "mxbai-embed-large"   # Find an Embed model
@@ -14,3 +18,17 @@ CHUNK_OVERLAP = 80
 
 # retrieval
 TOP_K = 5
+Q_SUPPORT_K = 0   # extra vector-search chunks added after a direct question lookup (0 = no search)
+
+# near-duplicate detection (SimHash, 64-bit); index lives next to the Chroma files
+DEDUP_INDEX_PATH = DB_DIR / "simhash_index.json"
+DEDUP_MAX_DISTANCE = 6   # max differing bits (of 64) to count as a near-duplicate
+
+# (source, question number) -> chunk ids, built at ingest
+QINDEX_PATH = DB_DIR / "question_index.json"
+
+# rebuild: chunks per embedding request
+EMBED_BATCH_SIZE = 64
+
+# batch size for lifecycle ops (delete/gc/compact) so we never load the whole collection
+BATCH_SIZE = 500
@@ -1,20 +1,62 @@
 # rag_db.py
 from __future__ import annotations
-from typing import List, Tuple, Set
-from langchain_chroma import Chroma
-from langchain_core.documents import Document
-from langchain_ollama import OllamaEmbeddings
-from app.RAG.rag_config import DB_DIR, EMBED_MODEL
+import hashlib
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple, Set
+from app.RAG.rag_config import DB_DIR, COLLECTION_NAME, EMBED_MODEL, BATCH_SIZE, DEDUP_INDEX_PATH, QINDEX_PATH
+from app.RAG.rag_dedup import SimHashIndex, drop_near_duplicates, simhash
+from app.RAG.rag_qindex import QuestionIndex
+from app.RAG.rag_lock import store_lock
+
+if TYPE_CHECKING:
+    # heavy: chromadb + langchain are imported lazily on first use
+    from langchain_chroma import Chroma
+    from langchain_core.documents import Document
 
 def get_embeddings():
+    from langchain_ollama import OllamaEmbeddings
     return OllamaEmbeddings(model=EMBED_MODEL)
 
-def get_db() -> Chroma:
+_live_path: Optional[Path] = None
+_live_path_lock = threading.Lock()
+
+def _live_db_path() -> Path:
+    """
+    DB_DIR is a symlink once the store has been swapped (see swap_db_dir).
+    Resolving it per call makes a running API open the current version; when
+    it moves, chromadb's per-path client cache (sqlite handles, HNSW indexes
+    in memory) is cleared so the replaced store isn't kept loaded.
+    """
+    global _live_path
+    path = DB_DIR.resolve()
+    with _live_path_lock:
+        if _live_path is not None and path != _live_path:
+            from chromadb.api.client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
+        _live_path = path
+    return path
+
+def get_db(persist_directory: Optional[Path] = None) -> Chroma:
+    from langchain_chroma import Chroma
+    path = persist_directory or _live_db_path()
     return Chroma(
-        persist_directory=str(DB_DIR),
+        collection_name=COLLECTION_NAME,
+        persist_directory=str(path),
         embedding_function=get_embeddings(),
     )
 
+def open_collection(persist_directory: Path):
+    """
+    Raw chromadb collection, for writing precomputed embeddings.
+    """
+    import chromadb
+    client = chromadb.PersistentClient(path=str(persist_directory))
+    return client.get_or_create_collection(COLLECTION_NAME)
+
 def get_existing_ids(db: Chroma) -> Set[str]:
     # include=[] → fetch only ids (works across common LC/Chroma versions)
     got = db.get(include=[])
@@ -27,20 +69,248 @@ def init_db(chunks_with_ids: List[Document], ids: List[str]) -> int:
     db.add_documents(chunks_with_ids, ids=ids)
     return len(ids)
 
-def diff_new(chunks_with_ids: List[Document], existing_ids: Set[str]) -> Tuple[List[Document], List[str]]:
-    new_chunks = [c for c in chunks_with_ids if c.metadata.get("id") not in existing_ids]
-    new_ids = [c.metadata["id"] for c in new_chunks]
-    return new_chunks, new_ids
-
-def update_db(chunks_with_ids: List[Document]) -> int:
-    db = get_db()
-    existing_ids = get_existing_ids(db)
-    new_chunks, new_ids = diff_new(chunks_with_ids, existing_ids)
-    if not new_ids:
-        return 0
-    db.add_documents(new_chunks, ids=new_ids)
-    return len(new_ids)
-
 def stats_db() -> int:
     db = get_db()
     return len(get_existing_ids(db))
+
+# ---- lifecycle: versioned sources, delete, gc, compact ----
+
+def iter_batches(db: Chroma, include: List[str], where: Optional[dict] = None,
+                 batch_size: int = BATCH_SIZE) -> Iterator[dict]:
+    """
+    Pages through the collection (or a `where` slice of it) without loading it all.
+    """
+    offset = 0
+    while True:
+        got = db.get(where=where, include=include, limit=batch_size, offset=offset)
+        if not got.get("ids"):
+            return
+        yield got
+        offset += len(got["ids"])
+
+def source_ids(db: Chroma, source: str) -> Dict[str, Optional[str]]:
+    """
+    chunk_id -> stored version for every chunk of `source`.
+    """
+    out: Dict[str, Optional[str]] = {}
+    for got in iter_batches(db, include=["metadatas"], where={"source": source}):
+        for cid, meta in zip(got["ids"], got["metadatas"]):
+            out[cid] = (meta or {}).get("version")
+    return out
+
+def list_sources(db: Chroma) -> Set[str]:
+    sources: Set[str] = set()
+    for got in iter_batches(db, include=["metadatas"]):
+        sources.update((meta or {}).get("source", "unknown_source") for meta in got["metadatas"])
+    return sources
+
+def delete_ids(db: Chroma, ids: List[str], batch_size: int = BATCH_SIZE) -> int:
+    for i in range(0, len(ids), batch_size):
+        db.delete(ids=ids[i:i + batch_size])
+    return len(ids)
+
+def source_version(chunks_with_ids: List[Document]) -> str:
+    h = hashlib.sha256()
+    for ch in chunks_with_ids:
+        h.update(ch.page_content.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+def replace_source(source: str, chunks_with_ids: List[Document]) -> dict:
+    """
+    Versioned ingest for one source: the new chunks are upserted over the old
+    ids, then any ids left over from the previous version are deleted, so a
+    re-upload replaces the old version in one call. No-op if the stored
+    version matches and every chunk is still stored or still linked to a
+    stored chunk (re-ingesting is how orphaned near-duplicates recover).
+    Near-duplicates of other sources are skipped (see rag_dedup).
+    """
+    with store_lock():
+        return _replace_source(source, chunks_with_ids)
+
+def _replace_source(source: str, chunks_with_ids: List[Document]) -> dict:
+    db = get_db()
+    version = source_version(chunks_with_ids)
+    old = source_ids(db, source)
+    index = SimHashIndex.load(DEDUP_INDEX_PATH)
+    all_ids = [c.metadata["id"] for c in chunks_with_ids]
+    resolved = all(cid in old or cid in index.links for cid in all_ids)
+    if old and set(old.values()) == {version} and resolved:
+        return {"added": 0, "embeddings_saved": 0, "removed": 0, "promoted": 0, "orphaned": 0}
+
+    for ch in chunks_with_ids:
+        ch.metadata["version"] = version
+
+    # ids that keep their place but get new text can no longer stand in for
+    # other sources' near-duplicates
+    new_hashes = {c.metadata["id"]: simhash(c.page_content) for c in chunks_with_ids}
+    changed = [cid for cid in old if cid in new_hashes and index.hashes.get(cid) != new_hashes[cid]]
+    own = set(all_ids)
+    orphaned = [dup for dup in index.orphan_links(changed) if dup not in own]
+
+    index.discard(list(old) + all_ids)
+    unique_chunks, skipped = drop_near_duplicates(chunks_with_ids, index)
+    new_ids = [c.metadata["id"] for c in unique_chunks]
+    if new_ids:
+        db.add_documents(unique_chunks, ids=new_ids)  # upsert: same ids overwrite the old version
+
+    kept = set(new_ids)
+    stale = [cid for cid in old if cid not in kept]
+    delete_ids(db, stale)
+    orphaned += index.orphan_links(stale)
+
+    qindex = QuestionIndex.load(QINDEX_PATH)
+    qindex.drop_ids(changed + stale)
+    qindex.set_source(source, chunks_with_ids, index.links)
+    promoted, lost = promote_orphans(orphaned, index, qindex, lambda docs: _store(db, docs))
+    index.save()
+    qindex.save()
+    return {"added": len(new_ids), "embeddings_saved": skipped, "removed": len(stale),
+            "promoted": promoted, "orphaned": lost}
+
+def _store(db: Chroma, docs: List[Document]) -> None:
+    db.add_documents(docs, ids=[d.metadata["id"] for d in docs])
+
+def _document(page_content: str, metadata: dict) -> Document:
+    from langchain_core.documents import Document
+    return Document(page_content=page_content, metadata=metadata)
+
+def promote_orphans(dup_ids: List[str], index: SimHashIndex, qindex: QuestionIndex,
+                    store: Callable[[List[Document]], None]) -> Tuple[int, int]:
+    """
+    Near-duplicates whose canonical chunk was deleted or rewritten are
+    re-ingested from the text kept in the SimHash index: each one is either
+    linked to another surviving near-duplicate or embedded via `store`, and
+    its question-index entries follow. Returns (embedded, lost); lost counts
+    links recorded before duplicate text was kept, which can't be restored.
+    """
+    docs: List[Document] = []
+    lost = 0
+    for dup in dup_ids:
+        saved = index.duplicates.pop(dup, None)
+        if saved is None:
+            lost += 1
+            continue
+        docs.append(_document(saved["page_content"], dict(saved["metadata"])))
+    kept, _ = drop_near_duplicates(docs, index)
+    if kept:
+        store(kept)
+    for doc in docs:
+        cid = doc.metadata["id"]
+        source = doc.metadata.get("source")
+        if source is not None:
+            qindex.add_chunk(source, index.links.get(cid, cid), doc.metadata.get("q_numbers", ""))
+    return len(kept), lost
+
+def delete_source(source: str, db: Optional[Chroma] = None) -> Tuple[int, int, int]:
+    """
+    Removes every chunk of `source`, including its skipped near-duplicates.
+    Other sources' near-duplicates of the deleted chunks are promoted (see
+    promote_orphans). Returns (chunks deleted, promoted, lost).
+    """
+    with store_lock():
+        db = db or get_db()
+        ids = list(source_ids(db, source))
+        delete_ids(db, ids)
+        index = SimHashIndex.load(DEDUP_INDEX_PATH)
+        index.discard(ids + index.duplicates_of_source(source))
+        orphaned = index.orphan_links(ids)
+        qindex = QuestionIndex.load(QINDEX_PATH)
+        qindex.drop_source(source)
+        qindex.drop_ids(ids)
+        promoted, lost = promote_orphans(orphaned, index, qindex, lambda docs: _store(db, docs))
+        index.save()
+        qindex.save()
+    return len(ids), promoted, lost
+
+def compact_db(batch_size: int = BATCH_SIZE) -> Tuple[int, int, int]:
+    """
+    Copies every stored vector (no re-embedding) into a fresh persistent store
+    and swaps it in, dropping the space held by deleted chunks.
+    Returns (chunks copied, bytes on disk before, bytes after), counting every
+    store directory (see store_disk_usage). Holds the store lock
+    throughout, so uploads wait instead of landing in the store being replaced.
+    """
+    with store_lock():
+        return _compact_db(batch_size)
+
+def _compact_db(batch_size: int) -> Tuple[int, int, int]:
+    src = get_db()
+    build_dir = DB_DIR.with_name(DB_DIR.name + ".compact")
+    if build_dir.exists():
+        shutil.rmtree(build_dir)
+    dst = open_collection(build_dir)
+
+    copied = 0
+    for got in iter_batches(src, include=["embeddings", "documents", "metadatas"], batch_size=batch_size):
+        dst.add(
+            ids=got["ids"],
+            embeddings=got["embeddings"],
+            documents=got["documents"],
+            metadatas=got["metadatas"],
+        )
+        copied += len(got["ids"])
+    del src, dst
+
+    for sidecar in (DEDUP_INDEX_PATH, QINDEX_PATH):
+        if sidecar.exists():
+            shutil.copy2(sidecar, build_dir / sidecar.name)
+    before = store_disk_usage() - dir_size(build_dir)
+    swap_db_dir(build_dir)
+    return copied, before, store_disk_usage()
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file() and not f.is_symlink())
+
+def store_disk_usage() -> int:
+    """
+    Bytes used by DB_DIR's real directories: the live version plus anything
+    left beside it (other versions, build or stray directories).
+    """
+    dirs = [p for p in DB_DIR.parent.glob(f"{DB_DIR.name}*") if p.is_dir() and not p.is_symlink()]
+    return sum(dir_size(p) for p in dirs)
+
+def swap_db_dir(build_dir: Path) -> None:
+    """
+    Makes `build_dir` the live store. DB_DIR is a symlink to a versioned
+    directory (DB_DIR.v<ns>) and is flipped with one os.replace, so readers
+    see either the old store or the new one. Before the first swap DB_DIR is
+    a plain directory; it is moved aside as a version of its own and put back
+    if the flip fails. Once the link points at the new store every other
+    version is removed (a reader mid-query keeps its already-open files on
+    POSIX). Running API processes need no restart: get_db() resolves the
+    link per call and drops clients cached on the old path.
+    Caller holds store_lock().
+    """
+    target = DB_DIR.with_name(f"{DB_DIR.name}.v{time.time_ns()}")
+    build_dir.rename(target)
+
+    previous: Optional[Path] = None
+    migrated = False
+    if DB_DIR.is_symlink():
+        previous = DB_DIR.resolve()
+    elif DB_DIR.exists():
+        previous = DB_DIR.with_name(f"{DB_DIR.name}.v0")
+        DB_DIR.rename(previous)
+        migrated = True
+
+    try:
+        _point_db_dir_at(target)
+    except OSError:
+        if migrated and not DB_DIR.exists() and not DB_DIR.is_symlink():
+            previous.rename(DB_DIR)
+        raise
+
+    for old in DB_DIR.parent.glob(f"{DB_DIR.name}.v*"):
+        if old.is_dir() and not old.is_symlink() and old.name != target.name:
+            shutil.rmtree(old)
+
+def _point_db_dir_at(target: Path) -> None:
+    link = DB_DIR.with_name(DB_DIR.name + ".link")
+    link.unlink(missing_ok=True)
+    link.symlink_to(target.name)
+    if DB_DIR.is_dir() and not DB_DIR.is_symlink():
+        # a reader recreated DB_DIR while it was briefly missing during the
+        # first swap: set that aside (never delete it) so the link can take its place
+        DB_DIR.rename(DB_DIR.with_name(f"{DB_DIR.name}.stray{time.time_ns()}"))
+    os.replace(link, DB_DIR)
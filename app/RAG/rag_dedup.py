@@ -0,0 +1,174 @@
+# rag_dedup.py
+from __future__ import annotations
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+from app.RAG.rag_config import DEDUP_INDEX_PATH, DEDUP_MAX_DISTANCE
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+HASH_BITS = 64
+BANDS = 8                      # pigeonhole: distance < BANDS ⇒ at least one band matches exactly
+BAND_BITS = HASH_BITS // BANDS
+SHINGLE = 3
+
+_WORD = re.compile(r"\w+")
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash over word 3-gram shingles (case/whitespace-insensitive).
+    """
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE]) for i in range(len(words) - SHINGLE + 1)]
+
+    weights = [0] * HASH_BITS
+    for sh in shingles:
+        h = int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(HASH_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+
+    out = 0
+    for bit, w in enumerate(weights):
+        if w > 0:
+            out |= 1 << bit
+    return out
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def _bands(h: int) -> List[Tuple[int, int]]:
+    mask = (1 << BAND_BITS) - 1
+    return [(i, (h >> (i * BAND_BITS)) & mask) for i in range(BANDS)]
+
+class SimHashIndex:
+    """
+    Persistent chunk_id -> simhash map, plus links from skipped near-duplicates
+    to the chunk that was embedded in their place. The text and metadata of
+    each skipped chunk are kept too (`duplicates`), so it can be promoted to a
+    stored chunk if its canonical chunk is deleted or rewritten. Wrap
+    load() ... save() in rag_lock.store_lock() when updating the live index.
+    """
+
+    def __init__(self, path: Path = DEDUP_INDEX_PATH, max_distance: int = DEDUP_MAX_DISTANCE):
+        if max_distance >= BANDS:
+            raise ValueError(f"max_distance must be < {BANDS} for banded lookup")
+        self.path = Path(path)
+        self.max_distance = max_distance
+        self.hashes: Dict[str, int] = {}
+        self.links: Dict[str, str] = {}
+        self.duplicates: Dict[str, dict] = {}
+        self._buckets: Dict[Tuple[int, int], Set[str]] = {}
+
+    @classmethod
+    def load(cls, path: Path = DEDUP_INDEX_PATH) -> "SimHashIndex":
+        index = cls(path)
+        if index.path.exists():
+            data = json.loads(index.path.read_text())
+            for cid, h in data.get("hashes", {}).items():
+                index.add(cid, int(h, 16))
+            index.links = dict(data.get("links", {}))
+            index.duplicates = dict(data.get("duplicates", {}))
+        return index
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "hashes": {cid: f"{h:016x}" for cid, h in self.hashes.items()},
+            "links": self.links,
+            "duplicates": self.duplicates,
+        }
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data))
+        tmp.replace(self.path)
+
+    def add(self, chunk_id: str, h: int) -> None:
+        self.hashes[chunk_id] = h
+        for band in _bands(h):
+            self._buckets.setdefault(band, set()).add(chunk_id)
+
+    def find(self, h: int) -> Optional[str]:
+        for band in _bands(h):
+            for cid in self._buckets.get(band, ()):
+                if hamming(h, self.hashes[cid]) <= self.max_distance:
+                    return cid
+        return None
+
+    def link(self, duplicate_id: str, canonical_id: str, saved: Optional[dict] = None) -> None:
+        """
+        `saved` is {"page_content", "metadata"} of the skipped chunk.
+        """
+        self.links[duplicate_id] = canonical_id
+        if saved is not None:
+            self.duplicates[duplicate_id] = saved
+
+    def duplicates_of_source(self, source: str) -> List[str]:
+        """
+        Skipped chunk ids belonging to `source` (links made before duplicate
+        text was kept are matched by their "{source}:" id prefix).
+        """
+        prefix = f"{source}:"
+        return [
+            dup for dup in self.links
+            if self.duplicates.get(dup, {}).get("metadata", {}).get("source") == source
+            or (dup not in self.duplicates and dup.startswith(prefix))
+        ]
+
+    def discard(self, chunk_ids: Iterable[str]) -> None:
+        """
+        Forget the hashes (and outgoing links) of chunks removed from the store.
+        """
+        for cid in chunk_ids:
+            self.links.pop(cid, None)
+            self.duplicates.pop(cid, None)
+            h = self.hashes.pop(cid, None)
+            if h is None:
+                continue
+            for band in _bands(h):
+                bucket = self._buckets.get(band)
+                if bucket is not None:
+                    bucket.discard(cid)
+                    if not bucket:
+                        del self._buckets[band]
+
+    def orphan_links(self, chunk_ids: Iterable[str]) -> List[str]:
+        """
+        Drop links pointing at removed chunks; returns the duplicate ids that
+        lost their canonical chunk. Their saved text stays in `duplicates`
+        for promotion (rag_db.promote_orphans).
+        """
+        removed = set(chunk_ids)
+        orphaned = [dup for dup, canon in self.links.items() if canon in removed]
+        for dup in orphaned:
+            del self.links[dup]
+        return orphaned
+
+def drop_near_duplicates(chunks_with_ids: List[Document], index: SimHashIndex) -> Tuple[List[Document], int]:
+    """
+    Returns (chunks to embed, number skipped). Skipped chunks are linked to the
+    indexed chunk they duplicate. Chunks whose id is already indexed are kept
+    as-is so re-ingesting the same chunk id never links it to itself.
+    Call index.save() once the kept chunks are stored.
+    """
+    kept: List[Document] = []
+    skipped = 0
+    for ch in chunks_with_ids:
+        cid = ch.metadata["id"]
+        if cid in index.hashes:
+            kept.append(ch)
+            continue
+        h = simhash(ch.page_content)
+        match = index.find(h)
+        if match is not None and match != cid:
+            index.link(cid, match, {"page_content": ch.page_content, "metadata": dict(ch.metadata)})
+            skipped += 1
+            continue
+        index.add(cid, h)
+        index.duplicates.pop(cid, None)
+        kept.append(ch)
+    return kept, skipped
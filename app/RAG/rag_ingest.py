@@ -1,23 +1,37 @@
 # rag_ingest.py
 from __future__ import annotations
-from typing import List, Tuple
-from langchain_community.document_loaders import PyPDFDirectoryLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
+from typing import TYPE_CHECKING, Dict, List, Tuple
 from app.RAG.rag_config import PDF_DIR, CHUNK_SIZE, CHUNK_OVERLAP
+from app.RAG.rag_qindex import tag_questions
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
 
 def load_documents() -> List[Document]:
+    from langchain_community.document_loaders import PyPDFDirectoryLoader
     loader = PyPDFDirectoryLoader(str(PDF_DIR))
     return loader.load()
 
+def load_and_split(path: str) -> List[Document]:
+    """
+    One PDF -> chunks, with the same metadata PyPDFDirectoryLoader would set.
+    Top-level so it can run in a worker process.
+    """
+    from langchain_community.document_loaders import PyPDFLoader
+    return split_documents(PyPDFLoader(path).load())
+
 def split_documents(documents: List[Document]) -> List[Document]:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
         length_function=len,
         is_separator_regex=False,
+        add_start_index=True,  # lets tag_questions place each chunk within its page
     )
-    return splitter.split_documents(documents)
+    chunks = splitter.split_documents(documents)
+    tag_questions(documents, chunks)
+    return chunks
 
 def attach_chunk_ids(chunks: List[Document]) -> Tuple[List[Document], List[str]]:
     """
@@ -44,3 +58,9 @@ def attach_chunk_ids(chunks: List[Document]) -> Tuple[List[Document], List[str]]
         last_page_id = page_id
 
     return chunks, ids
+
+def group_by_source(chunks: List[Document]) -> Dict[str, List[Document]]:
+    groups: Dict[str, List[Document]] = {}
+    for ch in chunks:
+        groups.setdefault(ch.metadata.get("source", "unknown_source"), []).append(ch)
+    return groups
@@ -0,0 +1,24 @@
+# rag_lock.py
+from __future__ import annotations
+import fcntl
+from contextlib import contextmanager
+from typing import Iterator
+from app.RAG.rag_config import DB_DIR
+
+# next to DB_DIR rather than inside it, so the lock survives a swap of the store
+LOCK_PATH = DB_DIR.with_name(DB_DIR.name + ".lock")
+
+@contextmanager
+def store_lock() -> Iterator[None]:
+    """
+    Exclusive cross-process lock (API workers and the manage_db CLI) around
+    every load -> modify -> save of the sidecar indexes and around swaps of
+    DB_DIR. Not reentrant: take it once, at the outermost call.
+    """
+    LOCK_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(LOCK_PATH, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
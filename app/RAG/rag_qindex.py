@@ -0,0 +1,243 @@
+# rag_qindex.py
+from __future__ import annotations
+import json
+import os
+import re
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+from app.RAG.rag_config import QINDEX_PATH, UPLOAD_SOURCE_PREFIX
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# "Q3", "Q.3", "Question 3", "Problem 3" at the start of a line
+_EXPLICIT = re.compile(r"^[ \t]*(?:Q|Question|Problem)[ \t]*\.?[ \t]*(\d+)\b", re.M | re.I)
+# "3." / "3)" at the start of a line; only trusted when numbering is sequential
+_BARE = re.compile(r"^[ \t]*(\d+)[.)](?=\s)", re.M)
+# "Part B", "Section 2 (40 pts)", "Instructions:" on a line of their own; numbering restarts after them
+_HEADING = re.compile(
+    r"^[ \t]*(?:(?:Part|Section)[ \t]+(?:\d+|[IVX]+|[A-Z])(?=[ \t]*(?:[:.(\-–—]|$))"
+    r"|(?P<instructions>Instructions|Directions)\b)",
+    re.M | re.I,
+)
+
+def normalize_q(q_number: str) -> str:
+    """
+    "Q3", "Q03", "question 3", "3." -> "3". Unrecognized input is returned stripped.
+    Used for both the stored keys and lookups.
+    """
+    m = re.search(r"\d+", q_number or "")
+    return str(int(m.group(0))) if m else (q_number or "").strip()
+
+def uses_explicit_markers(pages: List[str]) -> bool:
+    return any(_EXPLICIT.search(p) for p in pages)
+
+def find_boundaries(pages: List[str]) -> List[List[Tuple[int, str]]]:
+    """
+    Per page, the (offset, q_number) where each question starts. Explicit
+    Q/Question/Problem markers win, but only while the numbers increase, so a
+    line like "Q1 and Q2 refer to the figure" doesn't reopen Q1. Bare "N."
+    numbering is only used when a document has no explicit markers, and then
+    only if it counts up from 1 (so sub-lists inside a question aren't
+    mistaken for new questions).
+    Numbering restarts after a "Part B" / "Section 2" heading (Part B's Q1 is
+    filed under "1" too). A bare list under an "Instructions" heading is not
+    questions: it is skipped until the next heading or until it restarts at 1.
+    """
+    explicit = uses_explicit_markers(pages)
+    marker = _EXPLICIT if explicit else _BARE
+    last = 0
+    in_instructions = False
+    out: List[List[Tuple[int, str]]] = []
+    for p in pages:
+        events = [(m.start(), 0, m) for m in _HEADING.finditer(p)]
+        events += [(m.start(), 1, m) for m in marker.finditer(p)]
+        found = []
+        for start, is_marker, m in sorted(events, key=lambda e: e[:2]):
+            if not is_marker:
+                last = 0
+                in_instructions = not explicit and m.group("instructions") is not None
+                continue
+            n = int(m.group(1))
+            if in_instructions:
+                if not (n == 1 and last >= 1):
+                    last = n
+                    continue
+                in_instructions, last = False, 0
+            if (n > last) if explicit else (n == last + 1):
+                found.append((start, str(n)))
+                last = n
+        out.append(found)
+    return out
+
+def tag_questions(pages: List[Document], chunks: List[Document]) -> None:
+    """
+    Sets chunk.metadata["q_numbers"] (comma-separated, Chroma metadata must be
+    scalar) to every question a chunk overlaps, and chunk.metadata["q_marker"]
+    to "explicit" or "bare" (how that source numbers its questions). Needs
+    chunks split with add_start_index=True; pages are grouped by source and
+    read in page order.
+    """
+    by_source: Dict[str, List[Document]] = {}
+    for page in pages:
+        by_source.setdefault(page.metadata.get("source", "unknown_source"), []).append(page)
+
+    # (source, page) -> [(offset, q)], with the question carried over from the previous page at offset -1
+    spans: Dict[Tuple[str, object], List[Tuple[int, str]]] = {}
+    kinds: Dict[str, str] = {}
+    for source, src_pages in by_source.items():
+        src_pages.sort(key=lambda d: d.metadata.get("page", 0))
+        texts = [d.page_content for d in src_pages]
+        kinds[source] = "explicit" if uses_explicit_markers(texts) else "bare"
+        current: Optional[str] = None
+        for page, found in zip(src_pages, find_boundaries(texts)):
+            carried = [(-1, current)] if current is not None else []
+            spans[(source, page.metadata.get("page", 0))] = carried + found
+            if found:
+                current = found[-1][1]
+
+    for ch in chunks:
+        source = ch.metadata.get("source", "unknown_source")
+        page_spans = spans.get((source, ch.metadata.get("page", 0)), [])
+        start = ch.metadata.get("start_index", 0)
+        end = start + len(ch.page_content)
+        qs: List[str] = []
+        for i, (offset, q) in enumerate(page_spans):
+            next_offset = page_spans[i + 1][0] if i + 1 < len(page_spans) else None
+            if offset < end and (next_offset is None or next_offset > start) and q not in qs:
+                qs.append(q)
+        if qs:
+            ch.metadata["q_numbers"] = ",".join(qs)
+            ch.metadata["q_marker"] = kinds[source]
+
+_CACHE: Dict[str, Tuple[Tuple[int, int], "QuestionIndex"]] = {}
+
+class QuestionIndex:
+    """
+    Persistent source -> q_number -> [chunk ids] map used for direct lookup,
+    plus the sources whose questions were only found by bare "N." numbering
+    (less reliable, see find_boundaries). Wrap load() ... save() in
+    rag_lock.store_lock() when updating the live index.
+    """
+
+    def __init__(self, path: Path = QINDEX_PATH):
+        self.path = Path(path)
+        self.sources: Dict[str, Dict[str, List[str]]] = {}
+        self.bare_sources: Set[str] = set()
+
+    @classmethod
+    def load(cls, path: Path = QINDEX_PATH) -> "QuestionIndex":
+        index = cls(path)
+        if index.path.exists():
+            data = json.loads(index.path.read_text())
+            if "bare_sources" in data:
+                index.sources = data["sources"]
+                index.bare_sources = set(data["bare_sources"])
+            else:  # written before bare_sources was recorded: just the map
+                index.sources = data
+        return index
+
+    @classmethod
+    def cached(cls, path: Path = QINDEX_PATH) -> "QuestionIndex":
+        """
+        Read-only view for the query path: parsed once, and again only when the
+        file changes. save() replaces the file and a store swap repoints
+        DB_DIR, so (inode, mtime) catches both.
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return cls(path)
+        key = (st.st_ino, st.st_mtime_ns)
+        hit = _CACHE.get(str(path))
+        if hit is not None and hit[0] == key:
+            return hit[1]
+        index = cls.load(path)
+        _CACHE[str(path)] = (key, index)
+        return index
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"sources": self.sources, "bare_sources": sorted(self.bare_sources)}))
+        tmp.replace(self.path)
+
+    def set_source(self, source: str, chunks_with_ids: List[Document], links: Dict[str, str]) -> None:
+        """
+        Rebuilds the entries of one source. Chunks skipped as near-duplicates
+        point at the chunk stored in their place (`links`).
+        """
+        questions: Dict[str, List[str]] = {}
+        bare = False
+        for ch in chunks_with_ids:
+            bare = bare or ch.metadata.get("q_marker") == "bare"
+            cid = ch.metadata["id"]
+            cid = links.get(cid, cid)
+            for q in filter(None, ch.metadata.get("q_numbers", "").split(",")):
+                ids = questions.setdefault(q, [])
+                if cid not in ids:
+                    ids.append(cid)
+        if questions:
+            self.sources[source] = questions
+        else:
+            self.sources.pop(source, None)
+        if bare:
+            self.bare_sources.add(source)
+        else:
+            self.bare_sources.discard(source)
+
+    def add_chunk(self, source: str, chunk_id: str, q_numbers: str) -> None:
+        questions = self.sources.setdefault(source, {})
+        for q in filter(None, q_numbers.split(",")):
+            ids = questions.setdefault(q, [])
+            if chunk_id not in ids:
+                ids.append(chunk_id)
+        if not questions:
+            del self.sources[source]
+
+    def drop_source(self, source: str) -> None:
+        self.sources.pop(source, None)
+        self.bare_sources.discard(source)
+
+    def is_bare(self, source: Optional[str]) -> bool:
+        return source in self.bare_sources
+
+    def resolve_filename(self, filename: str) -> Optional[str]:
+        """
+        The indexed source a client-side file name refers to: the upload of
+        that name ("upload:<filename>") or else the one PDF with that base
+        name. None if nothing, or more than one PDF, matches.
+        """
+        upload = f"{UPLOAD_SOURCE_PREFIX}{filename}"
+        if upload in self.sources:
+            return upload
+        matches = [s for s in self.sources
+                   if not s.startswith(UPLOAD_SOURCE_PREFIX) and re.split(r"[\\/]", s)[-1] == filename]
+        return matches[0] if len(matches) == 1 else None
+
+    def drop_ids(self, chunk_ids: Iterable[str]) -> None:
+        """
+        Removes chunk ids (deleted, or whose text changed) from every source's
+        entries, e.g. near-duplicates of other sources that pointed at them.
+        """
+        gone = set(chunk_ids)
+        if not gone:
+            return
+        for source in list(self.sources):
+            questions = self.sources[source]
+            for q in list(questions):
+                questions[q] = [cid for cid in questions[q] if cid not in gone]
+                if not questions[q]:
+                    del questions[q]
+            if not questions:
+                del self.sources[source]
+
+    def lookup(self, q_number: str, source: Optional[str] = None) -> Dict[str, List[str]]:
+        """
+        source -> chunk ids for question `q_number`, across all sources unless one is given.
+        """
+        q = normalize_q(q_number)
+        if source is not None:
+            ids = self.sources.get(source, {}).get(q)
+            return {source: ids} if ids else {}
+        return {src: qs[q] for src, qs in self.sources.items() if q in qs}
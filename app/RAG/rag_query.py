@@ -1,12 +1,13 @@
 # rag_query.py
 from __future__ import annotations
-from typing import List
-from langchain_chroma import Chroma
-from rag_db import get_db
-from rag_config import TOP_K, LLM_MODEL
-import ollama
+from typing import TYPE_CHECKING, List
+from app.RAG.rag_db import get_db
+from app.RAG.rag_config import TOP_K, LLM_MODEL
 import re
 
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+
 def socratic_prompt(system: str, user_msg: str, context_blocks: List[str]) -> str:
     """
     Builds your ### Input / ### Output frame with retrieved context.
@@ -46,10 +47,12 @@ def ask_with_rag(question: str, system: str = "You are a Socratic tutor. Never r
     ctx = retrieve_context(db, question, TOP_K)
     prompt = socratic_prompt(system=system, user_msg=question, context_blocks=ctx)
 
+    import ollama
+
     resp = ollama.generate(
         model=LLM_MODEL,
         prompt=prompt,
-        stop=["\n###"],  # keep it tidy
+        options={"stop": ["\n###"]},  # keep it tidy
     )
     raw = resp.get("response", "")
     answer = clean_quoted_output(raw)
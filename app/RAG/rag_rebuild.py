@@ -0,0 +1,234 @@
+# rag_rebuild.py
+from __future__ import annotations
+import json
+import shutil
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Deque, List, Set, Tuple
+from app.RAG.rag_config import (
+    DB_DIR, PDF_DIR, EMBED_BATCH_SIZE, DEDUP_INDEX_PATH, QINDEX_PATH, UPLOAD_SOURCE_PREFIX,
+)
+from app.RAG.rag_ingest import load_and_split, attach_chunk_ids, group_by_source
+from app.RAG.rag_db import (
+    get_db, get_embeddings, open_collection, source_version, swap_db_dir, iter_batches, list_sources,
+    promote_orphans,
+)
+from app.RAG.rag_dedup import SimHashIndex, drop_near_duplicates
+from app.RAG.rag_qindex import QuestionIndex
+from app.RAG.rag_lock import store_lock
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+BUILD_DIR = DB_DIR.with_name(DB_DIR.name + ".rebuild")
+CHECKPOINT = "rebuild_checkpoint.jsonl"
+
+def parse_pdfs(workers: int) -> List[Document]:
+    """
+    Loads and splits every PDF in PDF_DIR across `workers` processes.
+    Files are processed in sorted order so chunk ids are stable across runs.
+    """
+    paths = [str(p) for p in sorted(PDF_DIR.glob("*.pdf"))]
+    chunks: List[Document] = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for file_chunks in pool.map(load_and_split, paths):
+            chunks.extend(file_chunks)
+    return chunks
+
+def read_checkpoint(path: Path) -> Set[Tuple[str, str]]:
+    """
+    (chunk id, source version) pairs already written to the build store.
+    Lines from older runs that recorded bare ids are ignored, so those
+    chunks are embedded again rather than trusted.
+    """
+    done: Set[Tuple[str, str]] = set()
+    if path.exists():
+        for line in path.read_text().splitlines():
+            if line.strip():
+                done.update((cid, version) for cid, version in
+                            (entry for entry in json.loads(line) if isinstance(entry, list)))
+    return done
+
+def prune_build_store(build_dir: Path, keep: Set[str], batch_size: int = EMBED_BATCH_SIZE) -> int:
+    """
+    Deletes chunks left in the build store by an interrupted run that this
+    run no longer produces (a PDF removed, shortened or now a near-duplicate),
+    and drops them from the checkpoint so they are embedded again if they
+    come back. Returns chunks deleted.
+    """
+    collection = open_collection(build_dir)
+    stale: List[str] = []
+    offset = 0
+    while True:
+        got = collection.get(include=[], limit=batch_size, offset=offset)
+        if not got["ids"]:
+            break
+        stale.extend(cid for cid in got["ids"] if cid not in keep)
+        offset += len(got["ids"])
+    for i in range(0, len(stale), batch_size):
+        collection.delete(ids=stale[i:i + batch_size])
+
+    checkpoint = build_dir / CHECKPOINT
+    if stale and checkpoint.exists():
+        done = sorted(pair for pair in read_checkpoint(checkpoint) if pair[0] in keep)
+        tmp = checkpoint.with_suffix(".tmp")
+        tmp.write_text(json.dumps(done) + "\n" if done else "")
+        tmp.replace(checkpoint)
+    return len(stale)
+
+def embed_pipelined(chunks: List[Document], build_dir: Path, workers: int,
+                    batch_size: int = EMBED_BATCH_SIZE) -> int:
+    """
+    Embeds `chunks` in batches with up to `workers` requests in flight and
+    writes each finished batch (in order) to the store at `build_dir`.
+    Each written batch is appended to the checkpoint as (id, version) pairs,
+    so a rerun skips it unless the chunk's source has changed since.
+    """
+    checkpoint = build_dir / CHECKPOINT
+    done = read_checkpoint(checkpoint)
+    todo = [c for c in chunks if (c.metadata["id"], c.metadata["version"]) not in done]
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+
+    embeddings = get_embeddings()
+    collection = open_collection(build_dir)
+    written = 0
+    in_flight: Deque[Tuple[List[Document], Future]] = deque()
+
+    def flush_one() -> None:
+        nonlocal written
+        batch, fut = in_flight.popleft()
+        ids = [c.metadata["id"] for c in batch]
+        collection.upsert(
+            ids=ids,
+            embeddings=fut.result(),
+            documents=[c.page_content for c in batch],
+            metadatas=[c.metadata for c in batch],
+        )
+        with checkpoint.open("a") as f:
+            f.write(json.dumps([[c.metadata["id"], c.metadata["version"]] for c in batch]) + "\n")
+        written += len(ids)
+        print(f"[REBUILD] {len(chunks) - len(todo) + written}/{len(chunks)} chunks embedded")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch in batches:
+            if len(in_flight) >= workers:
+                flush_one()
+            texts = [c.page_content for c in batch]
+            in_flight.append((batch, pool.submit(embeddings.embed_documents, texts)))
+        while in_flight:
+            flush_one()
+    return written
+
+def check_no_drop(produced: Set[str]) -> None:
+    """
+    Refuses to replace a live store that has non-upload sources the rebuild
+    did not produce (e.g. PDF_DIR is empty or points somewhere else).
+    """
+    live = {s for s in list_sources(get_db()) if not s.startswith(UPLOAD_SOURCE_PREFIX)}
+    missing = sorted(live - produced)
+    if missing:
+        shown = ", ".join(repr(s) for s in missing[:5])
+        raise SystemExit(
+            f"[REBUILD] {len(missing)} live sources are not in PDF_DIR ({shown}); "
+            "refusing to swap. Re-run with --allow-drop to discard them."
+        )
+
+def carry_over_uploads(build_dir: Path, index: SimHashIndex, qindex: QuestionIndex) -> int:
+    """
+    Copies every upload: source from the live store into `build_dir` (stored
+    vectors, no re-embedding) together with its SimHash and question-index
+    entries. Uploaded PDFs are not kept on disk, so this is the only way they
+    survive a rebuild. Caller holds store_lock(). Returns chunks copied.
+    """
+    live = get_db()
+    dst = open_collection(build_dir)
+    copied = 0
+    for source in sorted(s for s in list_sources(live) if s.startswith(UPLOAD_SOURCE_PREFIX)):
+        for got in iter_batches(live, include=["embeddings", "documents", "metadatas"], where={"source": source}):
+            dst.upsert(
+                ids=got["ids"],
+                embeddings=got["embeddings"],
+                documents=got["documents"],
+                metadatas=got["metadatas"],
+            )
+            copied += len(got["ids"])
+
+    live_index = SimHashIndex.load(DEDUP_INDEX_PATH)
+    for cid, h in live_index.hashes.items():
+        if cid.startswith(UPLOAD_SOURCE_PREFIX):
+            index.add(cid, h)
+    for dup, canon in live_index.links.items():
+        if dup.startswith(UPLOAD_SOURCE_PREFIX):
+            index.link(dup, canon, live_index.duplicates.get(dup))
+    live_qindex = QuestionIndex.load(QINDEX_PATH)
+    for source, questions in live_qindex.sources.items():
+        if source.startswith(UPLOAD_SOURCE_PREFIX):
+            qindex.sources[source] = questions
+            if live_qindex.is_bare(source):
+                qindex.bare_sources.add(source)
+
+    # uploaded near-duplicates of chunks the rebuild did not reproduce are embedded now
+    missing = {canon for canon in index.links.values() if canon not in index.hashes}
+    orphaned = index.orphan_links(missing)
+    qindex.drop_ids(missing)
+    promoted, lost = promote_orphans(orphaned, index, qindex, lambda docs: _embed_into(dst, docs))
+    if promoted:
+        print(f"[REBUILD] Embedded {promoted} uploaded near-duplicate chunks whose match is gone.")
+    if lost:
+        print(f"[REBUILD] {lost} uploaded near-duplicate chunks from before duplicate text was kept were lost.")
+    return copied + promoted
+
+def _embed_into(collection, docs: List[Document]) -> None:
+    collection.upsert(
+        ids=[d.metadata["id"] for d in docs],
+        embeddings=get_embeddings().embed_documents([d.page_content for d in docs]),
+        documents=[d.page_content for d in docs],
+        metadatas=[d.metadata for d in docs],
+    )
+
+def rebuild_db(workers: int = 4, fresh: bool = False, allow_drop: bool = False) -> Tuple[int, int, int, int]:
+    """
+    Builds a new store from PDF_DIR in BUILD_DIR, resuming from its checkpoint
+    unless `fresh`, carries the live upload: sources over, then swaps it in
+    for DB_DIR. The live store is untouched until the swap. Unless
+    `allow_drop`, refuses to swap if live PDF sources would disappear.
+    Returns (chunks built, embedded this run, near-duplicates skipped, upload chunks carried over).
+    """
+    if fresh and BUILD_DIR.exists():
+        shutil.rmtree(BUILD_DIR)
+    BUILD_DIR.mkdir(parents=True, exist_ok=True)
+
+    chunks = parse_pdfs(workers)
+    chunks_with_ids, _ = attach_chunk_ids(chunks)
+    groups = group_by_source(chunks_with_ids)
+    if not allow_drop:
+        check_no_drop(set(groups))  # fail before hours of embedding, and again at swap time
+    for group in groups.values():
+        version = source_version(group)
+        for ch in group:
+            ch.metadata["version"] = version
+
+    # dedup is deterministic for a given PDF_DIR, so it is simply redone on resume
+    index = SimHashIndex(BUILD_DIR / DEDUP_INDEX_PATH.name)
+    unique_chunks, skipped = drop_near_duplicates(chunks_with_ids, index)
+
+    pruned = prune_build_store(BUILD_DIR, {c.metadata["id"] for c in unique_chunks})
+    if pruned:
+        print(f"[REBUILD] Removed {pruned} chunks left by an earlier run that this build no longer has.")
+    embedded = embed_pipelined(unique_chunks, BUILD_DIR, workers)
+    qindex = QuestionIndex(BUILD_DIR / QINDEX_PATH.name)
+    for source, group in groups.items():
+        qindex.set_source(source, group, index.links)
+
+    # uploads that landed while we were embedding are included: the lock
+    # holds them off until the new store is live
+    with store_lock():
+        if not allow_drop:
+            check_no_drop(set(groups))
+        carried = carry_over_uploads(BUILD_DIR, index, qindex)
+        index.save()
+        qindex.save()
+        (BUILD_DIR / CHECKPOINT).unlink(missing_ok=True)
+        swap_db_dir(BUILD_DIR)
+    return len(unique_chunks), embedded, skipped, carried
@@ -0,0 +1,4 @@
+# server-side generation limits: always applied, whatever the request asks for.
+# Kept here (not in app.services.llm) so schemas can use them without the services layer.
+MAX_TOKENS = 512
+DEFAULT_STOP = ["\n###"]
@@ -1,7 +1,11 @@
+import logging
 from fastapi import FastAPI
 from app.routers import auth, generate, rag
 from fastapi.middleware.cors import CORSMiddleware
 
+# app.* loggers (e.g. per-request generation stats) at INFO; uvicorn keeps its own handlers
+logging.basicConfig(level=logging.INFO, format="%(levelname)s:     %(name)s - %(message)s")
+
 def create_app() -> FastAPI:
     app = FastAPI()
     app.include_router(auth.router, prefix="/auth", tags=["auth"])
@@ -1,16 +1,33 @@
-from fastapi import APIRouter, Depends
+import logging
+from fastapi import APIRouter, Depends, Request
+from starlette.concurrency import run_in_threadpool
 from app.core.deps import get_current_active_user
 from app.schemas.prompts import PromptRequest
 from app.services.prompts import build_prompt, clean_quoted_output, retrieve_context
-from app.services.llm import ollama_generate
+from app.services.llm import ollama_generate_controlled
 from app.RAG.rag_db import get_db
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.post("/generate")
-def generate(req: PromptRequest, current_user = Depends(get_current_active_user)):
-    ctx = retrieve_context(get_db(), req.user_message)
+async def generate(req: PromptRequest, request: Request, current_user = Depends(get_current_active_user)):
+    # retrieval is blocking (Chroma + embedding call); keep it off the event loop
+    ctx = await run_in_threadpool(
+        lambda: retrieve_context(get_db(), req.user_message, q_number=req.q_number, filename=req.filename)
+    )
     prompt = build_prompt(req, ctx)
-    raw = ollama_generate(prompt)
-    answer = clean_quoted_output(raw)
-    return {"response": answer}
\ No newline at end of file
+    result = await ollama_generate_controlled(
+        prompt,
+        stop=req.stop,
+        max_tokens=req.max_tokens,
+        stop_at_closing_quote=req.stop_at_closing_quote,
+        is_disconnected=request.is_disconnected,
+    )
+    logger.info(
+        "generate: tokens=%d/%d avoided=%d wasted=%d stop=%s",
+        result["tokens"], result["num_predict"], result["tokens_avoided"],
+        result["wasted_tokens"], result["stop_reason"],
+    )
+    answer = clean_quoted_output(result["response"])
+    return {"response": answer}
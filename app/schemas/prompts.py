@@ -1,7 +1,15 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from app.core.generation import MAX_TOKENS, DEFAULT_STOP
 
 class PromptRequest(BaseModel):
     level: int
     subject: str
     q_number: str
-    user_message: str
\ No newline at end of file
+    user_message: str
+    # the assignment the question is from: the `filename` /upload returned, or a
+    # PDF's file name. Resolved against the question index; unknown names fall back to search
+    filename: str | None = Field(None, min_length=1, max_length=255, pattern=r"^[^/\\]+$")
+    # generation control
+    stop: list[str] = Field(default_factory=lambda: list(DEFAULT_STOP), max_length=4)
+    max_tokens: int = Field(256, ge=1, le=MAX_TOKENS)
+    stop_at_closing_quote: bool = True
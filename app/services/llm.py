@@ -1,5 +1,85 @@
-import ollama
+import re
+from typing import Awaitable, Callable
+from app.core.generation import MAX_TOKENS, DEFAULT_STOP
 
-def ollama_generate(prompt: str) -> str:
-    resp = ollama.generate(model="icarus", prompt=prompt)
-    return resp.get("response", "")
+# same span clean_quoted_output keeps: first "..." / “...” before a new section
+_QUOTED = re.compile(r'["“”]([\s\S]*?)["“”]')
+
+_client = None
+
+def _get_client():
+    # one AsyncClient (and httpx pool) per process, created on first use
+    global _client
+    if _client is None:
+        import ollama
+        _client = ollama.AsyncClient()
+    return _client
+
+def _options(stop: list[str] | None, max_tokens: int | None) -> dict:
+    # Ollama reads num_predict <= 0 as "no limit", so anything out of range gets the ceiling
+    if max_tokens is None or max_tokens < 1:
+        max_tokens = MAX_TOKENS
+    return {
+        "stop": DEFAULT_STOP + [s for s in (stop or []) if s and s not in DEFAULT_STOP],
+        "num_predict": min(max_tokens, MAX_TOKENS),
+    }
+
+def _answer_complete(text: str) -> bool:
+    return _QUOTED.search(text.split("\n###", 1)[0]) is not None
+
+async def ollama_generate_controlled(
+    prompt: str,
+    stop: list[str] | None = None,
+    max_tokens: int | None = None,
+    stop_at_closing_quote: bool = True,
+    is_disconnected: Callable[[], Awaitable[bool]] | None = None,
+) -> dict:
+    """
+    Streams a generation so it can end early: once the quoted hint is closed
+    (if stop_at_closing_quote) or when the HTTP client goes away. Closing the
+    stream drops the connection to Ollama, which cancels the generation.
+
+    Returns {"response", "tokens", "num_predict", "tokens_avoided",
+    "wasted_tokens", "stop_reason"}: tokens_avoided is the rest of the
+    num_predict budget that an early stop saved (0 if the model finished by
+    itself), wasted_tokens counts tokens generated after the quoted hint was
+    complete (only non-zero when not stopping at the closing quote;
+    clean_quoted_output throws those away).
+    """
+    options = _options(stop, max_tokens)
+    stream = await _get_client().generate(model="icarus", prompt=prompt, stream=True, options=options)
+
+    text = ""
+    tokens = 0
+    answer_tokens = None
+    stop_reason = "done"
+    try:
+        async for chunk in stream:
+            if chunk.get("done"):
+                # authoritative count of generated tokens when the model finishes by itself
+                tokens = chunk.get("eval_count") or tokens
+                stop_reason = chunk.get("done_reason") or stop_reason
+                break
+            text += chunk.get("response", "")
+            tokens += 1
+            if answer_tokens is None and _answer_complete(text):
+                answer_tokens = tokens
+                if stop_at_closing_quote:
+                    stop_reason = "closing_quote"
+                    break
+            if is_disconnected is not None and await is_disconnected():
+                stop_reason = "client_disconnected"
+                break
+    finally:
+        await stream.aclose()
+
+    wasted = tokens - answer_tokens if answer_tokens is not None else 0
+    early = stop_reason in ("closing_quote", "client_disconnected")
+    return {
+        "response": text,
+        "tokens": tokens,
+        "num_predict": options["num_predict"],
+        "tokens_avoided": max(options["num_predict"] - tokens, 0) if early else 0,
+        "wasted_tokens": wasted,
+        "stop_reason": stop_reason,
+    }
@@ -1,8 +1,11 @@
 import re
 from app.schemas.prompts import PromptRequest
-from app.RAG.rag_config import TOP_K
-from langchain_chroma import Chroma
-from typing import List
+from app.RAG.rag_config import TOP_K, Q_SUPPORT_K
+from app.RAG.rag_qindex import QuestionIndex
+from typing import TYPE_CHECKING, List
+
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
 
 def build_prompt(req: PromptRequest, context_blocks: List[str]) -> str:
 
@@ -37,6 +40,44 @@ def clean_quoted_output(text: str) -> str:
 
     return t
 
-def retrieve_context(db: Chroma, query: str, top_k: int = TOP_K):
-    docs = db.similarity_search(query, k=top_k)
-    return [d.page_content for d in docs]
\ No newline at end of file
+def retrieve_context(db: "Chroma", query: str, top_k: int = TOP_K,
+                     q_number: str | None = None, filename: str | None = None):
+    qindex = QuestionIndex.cached() if q_number else None
+    source = qindex.resolve_filename(filename) if qindex is not None and filename else None
+
+    # the caller named the document: direct lookup of the question's own
+    # chunks, no embedding call and no ANN search. Not for bare "N." numbering,
+    # which can be an instructions list; those go through the search below
+    if source is not None and not qindex.is_bare(source):
+        ids = qindex.lookup(q_number, source).get(source, [])[:top_k]
+        ctx = _fetch(db, ids)
+        if ctx:
+            support_k = min(Q_SUPPORT_K, top_k - len(ctx))
+            if support_k > 0:
+                for d in db.similarity_search(query, k=support_k + len(ctx)):
+                    if d.page_content not in ctx and len(ctx) < top_k:
+                        ctx.append(d.page_content)
+            return ctx
+
+    search_filter = {"source": source} if source is not None else None
+    docs = db.similarity_search(query, k=top_k, filter=search_filter)
+    ctx = [d.page_content for d in docs]
+    if qindex is not None and docs:
+        # only trust the question index for the named document, or else the one
+        # the search landed in, so an unindexed assignment never gets another one's "Q7"
+        target = source or docs[0].metadata.get("source")
+        ids = qindex.lookup(q_number, target).get(target, [])[:top_k]
+        if qindex.is_bare(target):
+            # bare numbering: only the question chunks the search also found
+            found = {d.metadata.get("id") for d in docs}
+            ids = [i for i in ids if i in found]
+        q_ctx = _fetch(db, ids)
+        ctx = (q_ctx + [c for c in ctx if c not in q_ctx])[:top_k]
+    return ctx
+
+def _fetch(db: "Chroma", ids: List[str]) -> List[str]:
+    if not ids:
+        return []
+    got = db.get(ids=ids, include=["documents"])
+    by_id = dict(zip(got["ids"], got["documents"]))
+    return [by_id[i] for i in ids if i in by_id]
\ No newline at end of file
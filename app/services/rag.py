@@ -1,32 +1,42 @@
 from fastapi import UploadFile
-from pypdf import PdfReader
 from io import BytesIO
-from langchain_core.documents import Document
+from starlette.concurrency import run_in_threadpool
 from app.RAG.rag_ingest import split_documents, attach_chunk_ids
-from app.RAG.rag_db import update_db
+from app.RAG.rag_db import replace_source
+from app.RAG.rag_config import UPLOAD_SOURCE_PREFIX
 
 async def ingest_file(file: UploadFile):
+    from pypdf import PdfReader
+    from langchain_core.documents import Document
+
     #read the pdf
     content = await file.read()
     reader = PdfReader(BytesIO(content))
 
+    source = f"{UPLOAD_SOURCE_PREFIX}{file.filename}"
     docs = []
     for i, page in enumerate(reader.pages):
         text = page.extract_text() or ""
-        docs.append(Document(page_content=text, metadata={"source": f"upload:{file.filename}", "page": i}))
+        docs.append(Document(page_content=text, metadata={"source": source, "page": i}))
 
     chunks = split_documents(docs)
     chunks_with_ids, _ = attach_chunk_ids(chunks)
-    added = update_db(chunks_with_ids)
-    if added == 0:
+
+    # re-uploading the same filename replaces the previous version's chunks;
+    # near-identical chunks (e.g. a revised handout under a new name) are skipped.
+    # Blocking (embedding + the store lock, which compact holds for minutes),
+    # so keep it off the event loop.
+    result = await run_in_threadpool(replace_source, source, chunks_with_ids)
+    if result["added"] == 0 and result["removed"] == 0:
         print("[UPDATE] No new chunks.")
     else:
-        print(f"[UPDATE] Added {added} new chunks.")
-    
-    return added
-
-
-
-    
-
+        print(f"[UPDATE] Added {result['added']} new chunks, removed {result['removed']} stale chunks.")
+    if result["embeddings_saved"]:
+        print(f"[UPDATE] Skipped {result['embeddings_saved']} near-duplicate chunks (embeddings saved).")
+    if result["promoted"]:
+        print(f"[UPDATE] Embedded {result['promoted']} near-duplicate chunks of other sources that matched replaced text.")
+    if result["orphaned"]:
+        print(f"[UPDATE] {result['orphaned']} near-duplicate chunks from before duplicate text was kept were lost.")
+
+    return result
 
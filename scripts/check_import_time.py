@@ -0,0 +1,102 @@
+# check_import_time.py
+"""
+Import-time budget check.
+
+Runs `python -X importtime -c "import <module>"` for each entry point and fails
+if the cumulative import time exceeds its budget, or if any of the heavy RAG/LLM
+dependencies got pulled in at import time (they must stay lazy).
+
+Usage (from the repo root):
+    python scripts/check_import_time.py
+    python scripts/check_import_time.py --budget-ms app.main=800
+"""
+from __future__ import annotations
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# module -> cumulative import budget in milliseconds
+BUDGETS_MS: Dict[str, float] = {
+    "app.main": 700.0,   # fastapi + pydantic + jose/passlib; the RAG stack must stay out
+    "app.RAG.manage_db": 300.0,
+}
+
+# must never be imported just by loading an entry point
+HEAVY_MODULES = (
+    "langchain_chroma",
+    "langchain_community",
+    "langchain_ollama",
+    "langchain_text_splitters",
+    "ollama",
+    "pypdf",
+    "chromadb",
+)
+
+def measure(module: str) -> Tuple[float, List[str]]:
+    """
+    Returns (cumulative ms for `module`, every top-level package imported).
+    """
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr}")
+
+    cumulative_us = 0
+    imported: List[str] = []
+    for line in proc.stderr.splitlines():
+        # "import time:      self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        imported.append(name.split(".", 1)[0])
+        if name == module:
+            cumulative_us = int(parts[1])
+    return cumulative_us / 1000.0, imported
+
+def parse_budget(value: str) -> Tuple[str, float]:
+    module, _, ms = value.partition("=")
+    if not module or not ms:
+        raise argparse.ArgumentTypeError("expected MODULE=MS")
+    return module, float(ms)
+
+def main() -> int:
+    p = argparse.ArgumentParser("Check import-time budgets")
+    p.add_argument("--budget-ms", type=parse_budget, action="append", default=[],
+                   help="override a budget, e.g. app.main=800")
+    args = p.parse_args()
+
+    budgets = dict(BUDGETS_MS)
+    budgets.update(dict(args.budget_ms))
+
+    failed = False
+    for module, budget in budgets.items():
+        try:
+            ms, imported = measure(module)
+        except RuntimeError as e:
+            print(f"[IMPORTTIME] FAIL {e}")
+            failed = True
+            continue
+        heavy = sorted(set(imported) & set(HEAVY_MODULES))
+        status = "OK"
+        if ms > budget or heavy:
+            status = "FAIL"
+            failed = True
+        print(f"[IMPORTTIME] {status} {module}: {ms:.1f} ms (budget {budget:.0f} ms)")
+        if heavy:
+            print(f"[IMPORTTIME]   eagerly imported: {', '.join(heavy)}")
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+import importlib.util
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_spec = importlib.util.spec_from_file_location("check_import_time", ROOT / "scripts" / "check_import_time.py")
+check_import_time = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(check_import_time)
+
+
+def imported_top_level(module):
+    code = f"import sys, {module}; print('\\n'.join(sorted({{m.split('.')[0] for m in sys.modules}})))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return set(out.stdout.split())
+
+
+def test_manage_db_does_not_import_heavy_modules():
+    assert not imported_top_level("app.RAG.manage_db") & set(check_import_time.HEAVY_MODULES)
+
+
+def test_app_main_does_not_import_heavy_modules():
+    pytest.importorskip("fastapi")
+    assert not imported_top_level("app.main") & set(check_import_time.HEAVY_MODULES)
+
+
+def test_manage_db_within_budget():
+    ms, _ = check_import_time.measure("app.RAG.manage_db")
+    assert ms <= check_import_time.BUDGETS_MS["app.RAG.manage_db"]
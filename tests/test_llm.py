@@ -0,0 +1,84 @@
+import asyncio
+
+from app.services import llm
+
+
+class FakeClient:
+    def __init__(self, tokens, done=None):
+        self.tokens = tokens
+        self.done = done
+        self.options = None
+        self.closed = False
+
+    async def generate(self, **kwargs):
+        self.options = kwargs["options"]
+
+        async def stream():
+            try:
+                for t in self.tokens:
+                    yield {"response": t}
+                if self.done is not None:
+                    yield {"done": True, **self.done}
+            finally:
+                self.closed = True
+
+        return stream()
+
+
+TOKENS = ["Think", ' "', "What", " is", " x", '?"', " extra", " junk", "\n"]
+
+
+def run(client, monkeypatch, **kwargs):
+    monkeypatch.setattr(llm, "_client", client)
+    return asyncio.run(llm.ollama_generate_controlled("prompt", **kwargs))
+
+
+def test_stops_at_closing_quote(monkeypatch):
+    client = FakeClient(TOKENS, done={"eval_count": 9, "done_reason": "stop"})
+    result = run(client, monkeypatch)
+
+    assert result == {"response": 'Think "What is x?"', "tokens": 6, "num_predict": llm.MAX_TOKENS,
+                      "tokens_avoided": llm.MAX_TOKENS - 6, "wasted_tokens": 0,
+                      "stop_reason": "closing_quote"}
+    assert client.closed
+
+
+def test_reports_tokens_avoided_against_the_requested_budget(monkeypatch):
+    client = FakeClient(TOKENS, done={"eval_count": 9, "done_reason": "stop"})
+    result = run(client, monkeypatch, max_tokens=100)
+
+    assert result["num_predict"] == 100
+    assert result["tokens_avoided"] == 94
+
+
+def test_counts_wasted_tokens_when_running_to_completion(monkeypatch):
+    client = FakeClient(TOKENS, done={"eval_count": 9, "done_reason": "stop"})
+    result = run(client, monkeypatch, stop_at_closing_quote=False)
+
+    assert result["tokens"] == 9
+    assert result["wasted_tokens"] == 3
+    assert result["tokens_avoided"] == 0
+    assert result["stop_reason"] == "stop"
+
+
+def test_cancels_on_client_disconnect(monkeypatch):
+    async def disconnected():
+        return True
+
+    client = FakeClient(TOKENS)
+    result = run(client, monkeypatch, is_disconnected=disconnected)
+
+    assert result["stop_reason"] == "client_disconnected"
+    assert result["tokens"] == 1
+    assert client.closed
+
+
+def test_server_side_limits_always_apply(monkeypatch):
+    client = FakeClient(['"ok"'])
+    for max_tokens, stop in [(-1, []), (None, None), (10_000, ["END"])]:
+        run(client, monkeypatch, max_tokens=max_tokens, stop=stop)
+        assert client.options["num_predict"] == llm.MAX_TOKENS
+        assert client.options["stop"][0] == "\n###"
+
+    run(client, monkeypatch, max_tokens=5, stop=["END"])
+    assert client.options == {"stop": ["\n###", "END"], "num_predict": 5}
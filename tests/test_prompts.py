@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pydantic")
+
+from app.RAG.rag_qindex import QuestionIndex  # noqa: E402
+from app.services import prompts  # noqa: E402
+
+TEXTS = {
+    "upload:hw.pdf:0:0": "1. Show your work.",
+    "upload:hw.pdf:0:1": "1. Compute x.",
+    "upload:hw.pdf:0:2": "2. Prove y.",
+    "other.pdf:0:0": "unrelated",
+}
+
+
+class FakeDB:
+    def __init__(self, hits):
+        self.hits = hits
+        self.searches = []
+
+    def similarity_search(self, query, k, filter=None):
+        self.searches.append(filter)
+        return [SimpleNamespace(page_content=TEXTS[i], metadata={"id": i, "source": i.rsplit(":", 2)[0]})
+                for i in self.hits][:k]
+
+    def get(self, ids, include):
+        return {"ids": ids, "documents": [TEXTS[i] for i in ids]}
+
+
+@pytest.fixture
+def qindex(monkeypatch):
+    index = QuestionIndex()
+    index.sources = {"upload:hw.pdf": {"1": ["upload:hw.pdf:0:0", "upload:hw.pdf:0:1"], "2": ["upload:hw.pdf:0:2"]}}
+    monkeypatch.setattr(QuestionIndex, "cached", classmethod(lambda cls: index))
+    return index
+
+
+def test_named_file_is_looked_up_without_a_search(qindex):
+    db = FakeDB([])
+    assert prompts.retrieve_context(db, "q", q_number="Q2", filename="hw.pdf") == ["2. Prove y."]
+    assert db.searches == []
+
+
+def test_bare_numbered_matches_must_be_confirmed_by_the_search(qindex):
+    qindex.bare_sources.add("upload:hw.pdf")
+    db = FakeDB(["other.pdf:0:0", "upload:hw.pdf:0:1"])
+
+    ctx = prompts.retrieve_context(db, "q", top_k=2, q_number="1", filename="hw.pdf")
+
+    assert ctx == ["1. Compute x.", "unrelated"]
+    assert db.searches == [{"source": "upload:hw.pdf"}]
+
+
+def test_unknown_filename_falls_back_to_the_search(qindex):
+    db = FakeDB(["other.pdf:0:0"])
+    assert prompts.retrieve_context(db, "q", q_number="1", filename="nope.pdf") == ["unrelated"]
+    assert db.searches == [None]
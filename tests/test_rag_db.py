@@ -0,0 +1,216 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from app.RAG import manage_db, rag_db, rag_lock
+from app.RAG.rag_dedup import SimHashIndex
+from app.RAG.rag_qindex import QuestionIndex
+
+Q1 = "alpha beta gamma delta epsilon zeta eta theta iota kappa " * 3
+Q2 = "one two three four five six seven eight nine ten " * 3
+NEW = "new text with entirely different words on this page " * 3
+
+
+class FakeChroma:
+    """Just enough of langchain's Chroma: get / add_documents (upsert) / delete."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None):
+        items = [
+            (cid, row) for cid, row in self.rows.items()
+            if (where is None or row["metadata"].get("source") == where["source"])
+            and (ids is None or cid in ids)
+        ]
+        start = offset or 0
+        items = items[start:start + limit] if limit else items
+        return {
+            "ids": [cid for cid, _ in items],
+            "documents": [row["text"] for _, row in items],
+            "metadatas": [row["metadata"] for _, row in items],
+            "embeddings": [[0.0] for _ in items],
+        }
+
+    def add_documents(self, docs, ids):
+        for doc, cid in zip(docs, ids):
+            self.rows[cid] = {"text": doc.page_content, "metadata": dict(doc.metadata)}
+
+    def delete(self, ids):
+        for cid in ids:
+            self.rows.pop(cid)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    db = FakeChroma()
+    monkeypatch.setattr(rag_db, "DB_DIR", tmp_path / "db")
+    monkeypatch.setattr(rag_db, "DEDUP_INDEX_PATH", tmp_path / "simhash_index.json")
+    monkeypatch.setattr(rag_db, "QINDEX_PATH", tmp_path / "question_index.json")
+    monkeypatch.setattr(rag_db, "BATCH_SIZE", 2)
+    monkeypatch.setattr(rag_lock, "LOCK_PATH", tmp_path / "db.lock")
+    monkeypatch.setattr(rag_db, "get_db", lambda *a: db)
+    monkeypatch.setattr(rag_db, "_document", lambda text, meta: SimpleNamespace(page_content=text, metadata=meta))
+    db.qindex = lambda: QuestionIndex.load(tmp_path / "question_index.json").sources
+    db.simhash = lambda: SimHashIndex.load(tmp_path / "simhash_index.json")
+    return db
+
+
+def chunks(source, texts, qs=None):
+    return [
+        SimpleNamespace(page_content=t, metadata={"source": source, "page": 0, "id": f"{source}:0:{i}",
+                                                  **({"q_numbers": qs[i]} if qs else {})})
+        for i, t in enumerate(texts)
+    ]
+
+
+# ---- replace_source / delete_source ----
+
+def test_replace_source_is_a_noop_for_the_same_version(store):
+    assert rag_db.replace_source("A", chunks("A", [Q1, Q2]))["added"] == 2
+    assert rag_db.replace_source("A", chunks("A", [Q1, Q2])) == {
+        "added": 0, "embeddings_saved": 0, "removed": 0, "promoted": 0, "orphaned": 0,
+    }
+
+
+def test_replace_source_deletes_leftovers_of_the_old_version(store):
+    rag_db.replace_source("A", chunks("A", [Q1, Q2], ["1", "2"]))
+
+    result = rag_db.replace_source("A", chunks("A", [NEW], ["1"]))
+
+    assert result["added"] == 1 and result["removed"] == 1
+    assert sorted(store.rows) == ["A:0:0"]
+    assert store.rows["A:0:0"]["text"] == NEW
+    assert store.qindex() == {"A": {"1": ["A:0:0"]}}
+
+
+def test_rewritten_canonical_chunk_promotes_other_sources_duplicates(store):
+    rag_db.replace_source("A", chunks("A", [Q1, Q2], ["1", "2"]))
+    assert rag_db.replace_source("B", chunks("B", [Q1], ["7"]))["embeddings_saved"] == 1
+    assert store.qindex()["B"] == {"7": ["A:0:0"]}
+
+    result = rag_db.replace_source("A", chunks("A", [NEW, Q2], ["1", "2"]))
+
+    assert result["promoted"] == 1 and result["orphaned"] == 0
+    assert store.rows["B:0:0"]["text"] == Q1
+    assert store.qindex()["B"] == {"7": ["B:0:0"]}
+
+
+def test_delete_source_promotes_duplicates_and_forgets_its_own(store):
+    rag_db.replace_source("A", chunks("A", [Q1, Q2], ["1", "2"]))
+    rag_db.replace_source("B", chunks("B", [Q1, NEW], ["1", "2"]))
+
+    assert rag_db.delete_source("A") == (2, 1, 0)
+    assert sorted(store.rows) == ["B:0:0", "B:0:1"]
+    assert store.qindex() == {"B": {"1": ["B:0:0"], "2": ["B:0:1"]}}
+
+    assert rag_db.delete_source("B") == (2, 0, 0)
+    index = store.simhash()
+    assert index.hashes == {} and index.links == {} and index.duplicates == {}
+    assert store.qindex() == {}
+
+
+def test_links_without_saved_text_are_reported_lost(store):
+    rag_db.replace_source("A", chunks("A", [Q1]))
+    index = store.simhash()
+    index.link("legacy:0:0", "A:0:0")  # recorded before duplicate text was kept
+    index.save()
+
+    assert rag_db.delete_source("A") == (1, 0, 1)
+
+
+# ---- swap_db_dir / compact_db ----
+
+def test_first_swap_migrates_the_plain_directory(store):
+    db_dir = rag_db.DB_DIR
+    db_dir.mkdir()
+    (db_dir / "chroma.sqlite3").write_text("old")
+    build = db_dir.with_name("build")
+    build.mkdir()
+    (build / "chroma.sqlite3").write_text("new")
+
+    rag_db.swap_db_dir(build)
+
+    assert db_dir.is_symlink()
+    assert (db_dir / "chroma.sqlite3").read_text() == "new"
+    assert sorted(p.name for p in db_dir.parent.iterdir() if p.name.startswith("db")) == [
+        "db", os.readlink(db_dir),
+    ]
+
+
+def test_later_swaps_flip_the_link_and_remove_old_versions(store):
+    db_dir = rag_db.DB_DIR
+    for i in range(3):
+        build = db_dir.with_name("build")
+        build.mkdir()
+        (build / "chroma.sqlite3").write_text(f"v{i}")
+        rag_db.swap_db_dir(build)
+
+    assert (db_dir / "chroma.sqlite3").read_text() == "v2"
+    versions = [p.name for p in db_dir.parent.glob("db.v*")]
+    assert versions == [os.readlink(db_dir)]
+
+
+def test_failed_first_swap_restores_the_live_directory(store, monkeypatch):
+    db_dir = rag_db.DB_DIR
+    db_dir.mkdir()
+    (db_dir / "chroma.sqlite3").write_text("old")
+    build = db_dir.with_name("build")
+    build.mkdir()
+
+    def fail(target):
+        raise OSError("no symlinks here")
+
+    monkeypatch.setattr(rag_db, "_point_db_dir_at", fail)
+    with pytest.raises(OSError):
+        rag_db.swap_db_dir(build)
+
+    assert not db_dir.is_symlink()
+    assert (db_dir / "chroma.sqlite3").read_text() == "old"
+
+
+def test_compact_copies_vectors_and_sidecars_and_reports_disk_usage(store, monkeypatch):
+    db_dir = rag_db.DB_DIR
+    db_dir.mkdir()
+    (db_dir / "garbage.bin").write_bytes(b"x" * 1000)
+    rag_db.replace_source("A", chunks("A", [Q1, Q2, NEW]))
+    # the real sidecars live inside the store directory
+    (db_dir / "simhash_index.json").write_text(rag_db.DEDUP_INDEX_PATH.read_text())
+    monkeypatch.setattr(rag_db, "DEDUP_INDEX_PATH", db_dir / "simhash_index.json")
+
+    written = {}
+
+    class Collection:
+        def __init__(self, path):
+            path.mkdir(parents=True, exist_ok=True)
+            self.path = path
+
+        def add(self, ids, embeddings, documents, metadatas):
+            written.update(zip(ids, documents))
+            (self.path / "chroma.sqlite3").write_text("compact")
+
+    monkeypatch.setattr(rag_db, "open_collection", Collection)
+
+    copied, before, after = rag_db.compact_db(batch_size=2)
+
+    assert copied == 3 and sorted(written) == ["A:0:0", "A:0:1", "A:0:2"]
+    assert db_dir.is_symlink() and (db_dir / "simhash_index.json").exists()
+    assert before > after
+    assert after == rag_db.store_disk_usage()
+
+
+# ---- gc ----
+
+def test_gc_is_a_dry_run_and_never_touches_uploads(monkeypatch):
+    deleted = []
+    monkeypatch.setattr(manage_db, "get_db", lambda: None)
+    monkeypatch.setattr(manage_db, "list_sources", lambda db: {"upload:hw1.pdf", "/pdf/a.pdf", "/pdf/gone.pdf"})
+    monkeypatch.setattr(manage_db, "referenced_sources", lambda: {"/pdf/a.pdf"})
+    monkeypatch.setattr(manage_db, "delete_source", lambda s, db: deleted.append(s) or (1, 0, 0))
+
+    manage_db.cmd_gc()
+    assert deleted == []
+
+    manage_db.cmd_gc(apply=True)
+    assert deleted == ["/pdf/gone.pdf"]
@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.RAG.rag_dedup import SimHashIndex, drop_near_duplicates, hamming, simhash
+
+HANDOUT = (
+    "Question 3. Prove that the vertex cover LP has an integral optimal solution for "
+    "bipartite graphs. Use the dual of the matching LP and complementary slackness to "
+    "argue which constraints are tight, then round the fractional solution and show "
+    "that the rounding never increases the cost of the cover. State every assumption."
+)
+REVISED = HANDOUT.replace("State every assumption.", "State each assumption.")
+OTHER = (
+    "Sampling: a bandlimited continuous time signal x(t) with maximum frequency 4 kHz "
+    "is sampled at 10 kHz. Sketch the spectrum of the sampled signal and explain whether "
+    "aliasing occurs, then design the ideal reconstruction filter and its cutoff."
+)
+
+
+def chunk(cid, text):
+    return SimpleNamespace(page_content=text, metadata={"id": cid})
+
+
+def test_simhash_is_close_for_small_edits_and_far_for_unrelated_text():
+    assert hamming(simhash(HANDOUT), simhash(REVISED)) <= 6
+    assert hamming(simhash(HANDOUT), simhash(OTHER)) > 6
+    assert simhash(HANDOUT) == simhash(HANDOUT.upper().replace(" ", "  "))
+
+
+def test_near_duplicates_are_skipped_and_linked(tmp_path):
+    index = SimHashIndex(tmp_path / "idx.json")
+    kept, skipped = drop_near_duplicates(
+        [chunk("a:0:0", HANDOUT), chunk("b:0:0", REVISED), chunk("b:0:1", OTHER)], index
+    )
+
+    assert [c.metadata["id"] for c in kept] == ["a:0:0", "b:0:1"]
+    assert skipped == 1
+    assert index.links == {"b:0:0": "a:0:0"}
+
+
+def test_reingesting_an_indexed_id_is_kept_not_self_linked(tmp_path):
+    index = SimHashIndex(tmp_path / "idx.json")
+    drop_near_duplicates([chunk("a:0:0", HANDOUT)], index)
+
+    kept, skipped = drop_near_duplicates([chunk("a:0:0", HANDOUT)], index)
+
+    assert len(kept) == 1 and skipped == 0
+    assert index.links == {}
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = tmp_path / "idx.json"
+    index = SimHashIndex(path)
+    drop_near_duplicates([chunk("a:0:0", HANDOUT), chunk("b:0:0", REVISED)], index)
+    index.save()
+
+    loaded = SimHashIndex.load(path)
+
+    assert loaded.hashes == index.hashes
+    assert loaded.links == index.links
+    assert loaded.find(simhash(REVISED)) == "a:0:0"
+
+
+def test_discard_removes_hash_from_lookup(tmp_path):
+    index = SimHashIndex(tmp_path / "idx.json")
+    drop_near_duplicates([chunk("a:0:0", HANDOUT)], index)
+
+    index.discard(["a:0:0"])
+
+    assert index.find(simhash(HANDOUT)) is None
+    kept, skipped = drop_near_duplicates([chunk("b:0:0", REVISED)], index)
+    assert len(kept) == 1 and skipped == 0
+
+
+def test_orphan_links_reports_duplicates_of_removed_chunks(tmp_path):
+    index = SimHashIndex(tmp_path / "idx.json")
+    drop_near_duplicates(
+        [chunk("a:0:0", HANDOUT), chunk("b:0:0", REVISED), chunk("c:0:0", OTHER)], index
+    )
+
+    assert index.orphan_links(["c:0:0"]) == []
+    assert index.orphan_links(["a:0:0"]) == ["b:0:0"]
+    assert index.links == {}
+
+
+def test_max_distance_must_fit_banded_lookup(tmp_path):
+    with pytest.raises(ValueError):
+        SimHashIndex(tmp_path / "idx.json", max_distance=8)
+
+
+def test_skipped_duplicates_keep_their_text_for_promotion(tmp_path):
+    path = tmp_path / "idx.json"
+    index = SimHashIndex(path)
+    dup = chunk("b:0:0", REVISED)
+    dup.metadata["source"] = "b"
+    drop_near_duplicates([chunk("a:0:0", HANDOUT), dup], index)
+    index.save()
+
+    loaded = SimHashIndex.load(path)
+    assert loaded.duplicates["b:0:0"] == {"page_content": REVISED, "metadata": {"id": "b:0:0", "source": "b"}}
+    assert loaded.duplicates_of_source("b") == ["b:0:0"]
+
+    # orphaning keeps the text; discarding the duplicate itself forgets it
+    assert loaded.orphan_links(["a:0:0"]) == ["b:0:0"]
+    assert "b:0:0" in loaded.duplicates
+    loaded.discard(["b:0:0"])
+    assert loaded.duplicates == {}
@@ -0,0 +1,144 @@
+import json
+from types import SimpleNamespace
+
+from app.RAG.rag_qindex import QuestionIndex, find_boundaries, normalize_q, tag_questions
+
+
+def doc(text, **metadata):
+    return SimpleNamespace(page_content=text, metadata=metadata)
+
+
+def test_explicit_markers():
+    pages = ["Intro\nQuestion 1 (10 pts)\nCompute x.\nQ2. Prove y.", "Problem 3\nSketch z."]
+    assert find_boundaries(pages) == [[(6, "1"), (pages[0].index("Q2"), "2")], [(0, "3")]]
+
+
+def test_explicit_markers_must_increase():
+    pages = ["Q1 Intro\nQ1 and Q2 refer to the figure below.\nQ2. next\nQ03 third"]
+    assert [q for _, q in find_boundaries(pages)[0]] == ["1", "2", "3"]
+
+
+def test_bare_numbers_only_count_up_from_one():
+    pages = ["intro\n1. first\n a) x\n1. again\n2. second", "3) third\n5. skipped"]
+    assert find_boundaries(pages) == [[(6, "1"), (30, "2")], [(0, "3")]]
+
+
+def test_explicit_markers_win_over_bare_numbers():
+    pages = ["Q1 Do this:\n1. part a\n2. part b\nQ2 Next"]
+    assert [q for _, q in find_boundaries(pages)[0]] == ["1", "2"]
+
+
+def test_numbering_restarts_at_part_headings():
+    pages = ["Part A\nQ1 first\nQ2 second\nPart B (40 pts)\nQ1 again\nQ2 again"]
+    assert [q for _, q in find_boundaries(pages)[0]] == ["1", "2", "1", "2"]
+
+    pages = ["1. a\n2. b\nSection 2\n1. c\n2. d"]
+    assert [q for _, q in find_boundaries(pages)[0]] == ["1", "2", "1", "2"]
+
+
+def test_bare_instructions_list_is_not_questions():
+    page = "Instructions:\n1. Show your work.\n2. Submit a PDF.\n\n1. Compute x.\n2. Prove y.\n3. Sketch z."
+    assert find_boundaries([page]) == [[(page.index("1. Compute"), "1"), (page.index("2. Prove"), "2"),
+                                        (page.index("3. Sketch"), "3")]]
+
+
+def test_headings_need_a_line_of_their_own():
+    pages = ["1. Part a of the proof\n2. Section 2 covers this\n3. done"]
+    assert [q for _, q in find_boundaries(pages)[0]] == ["1", "2", "3"]
+
+
+def test_normalize_q():
+    assert normalize_q("Q03") == "3"
+    assert normalize_q("Question 3") == "3"
+    assert normalize_q("3.") == "3"
+    assert normalize_q(" bonus ") == "bonus"
+
+
+def test_tag_questions_spans_and_carry_over():
+    p0 = "Homework 2\nQuestion 1\nCompute x.\nQuestion 2\nProve y."
+    p1 = "continued proof.\nQ3. Final question"
+    pages = [doc(p0, source="s", page=0), doc(p1, source="s", page=1)]
+    q2 = p0.index("Question 2")
+    q3 = p1.index("Q3")
+    chunks = [
+        doc(p0[:8], source="s", page=0, start_index=0),          # before any question
+        doc(p0[8:q2 - 2], source="s", page=0, start_index=8),    # inside Q1
+        doc(p0[q2 - 5:], source="s", page=0, start_index=q2 - 5),  # end of Q1 into Q2
+        doc(p1[:q3], source="s", page=1, start_index=0),         # Q2 carried onto page 1
+        doc(p1[q3:], source="s", page=1, start_index=q3),        # Q3
+    ]
+
+    tag_questions(pages, chunks)
+
+    assert [c.metadata.get("q_numbers") for c in chunks] == [None, "1", "1,2", "2", "3"]
+
+
+def test_index_lookup_links_and_drop_ids(tmp_path):
+    chunks = [
+        doc("a", id="s:0:0", q_numbers="1"),
+        doc("b", id="s:0:1", q_numbers="1,2"),
+        doc("c", id="s:1:0", q_numbers="2"),
+    ]
+    index = QuestionIndex(tmp_path / "q.json")
+    index.set_source("s", chunks, links={"s:1:0": "other:0:0"})
+
+    assert index.lookup("Q02") == {"s": ["s:0:1", "other:0:0"]}
+    assert index.lookup("1", source="t") == {}
+
+    index.drop_ids(["other:0:0", "s:0:0"])
+    assert index.sources == {"s": {"1": ["s:0:1"], "2": ["s:0:1"]}}
+
+
+def test_cached_reloads_when_file_changes(tmp_path):
+    path = tmp_path / "q.json"
+    index = QuestionIndex(path)
+    index.sources = {"s": {"3": ["a"]}}
+    index.save()
+
+    first = QuestionIndex.cached(path)
+    assert QuestionIndex.cached(path) is first
+
+    index.sources = {"s": {"3": ["b"]}}
+    index.save()
+    assert QuestionIndex.cached(path).lookup("3") == {"s": ["b"]}
+
+
+def test_bare_sources_are_recorded_and_persisted(tmp_path):
+    pages = [doc("1. first\n2. second", source="bare.pdf", page=0), doc("Q1 only", source="q.pdf", page=0)]
+    chunks = [doc("1. first", source="bare.pdf", page=0, start_index=0, id="bare.pdf:0:0"),
+              doc("Q1 only", source="q.pdf", page=0, start_index=0, id="q.pdf:0:0")]
+    tag_questions(pages, chunks)
+    assert [c.metadata["q_marker"] for c in chunks] == ["bare", "explicit"]
+
+    index = QuestionIndex(tmp_path / "q.json")
+    index.set_source("bare.pdf", chunks[:1], links={})
+    index.set_source("q.pdf", chunks[1:], links={})
+    index.save()
+
+    loaded = QuestionIndex.load(tmp_path / "q.json")
+    assert loaded.is_bare("bare.pdf") and not loaded.is_bare("q.pdf")
+    loaded.drop_source("bare.pdf")
+    assert loaded.bare_sources == set()
+
+
+def test_load_reads_the_old_plain_map(tmp_path):
+    path = tmp_path / "q.json"
+    path.write_text(json.dumps({"s": {"1": ["s:0:0"]}}))
+
+    index = QuestionIndex.load(path)
+    assert index.sources == {"s": {"1": ["s:0:0"]}} and index.bare_sources == set()
+
+
+def test_resolve_filename():
+    index = QuestionIndex()
+    index.sources = {
+        "upload:hw2.pdf": {"1": ["a"]},
+        "/data/pdfs/hw2.pdf": {"1": ["b"]},
+        "/data/pdfs/hw3.pdf": {"1": ["c"]},
+        "/data/pdfs/old/dup.pdf": {"1": ["d"]},
+        "/data/pdfs/dup.pdf": {"1": ["e"]},
+    }
+    assert index.resolve_filename("hw2.pdf") == "upload:hw2.pdf"
+    assert index.resolve_filename("hw3.pdf") == "/data/pdfs/hw3.pdf"
+    assert index.resolve_filename("dup.pdf") is None
+    assert index.resolve_filename("missing.pdf") is None
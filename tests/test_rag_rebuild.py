@@ -0,0 +1,135 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.RAG import rag_rebuild
+from app.RAG.manage_db import positive_int
+from app.RAG.rag_dedup import SimHashIndex
+from app.RAG.rag_qindex import QuestionIndex
+
+
+class FakeCollection:
+    """chromadb Collection: upsert / get(include, limit, offset) / delete."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        for cid, emb, doc, meta in zip(ids, embeddings, documents, metadatas):
+            self.rows[cid] = (emb, doc, meta)
+
+    def get(self, include=None, limit=None, offset=0, where=None):
+        ids = sorted(self.rows)[offset:offset + limit]
+        return {"ids": ids}
+
+    def delete(self, ids):
+        for cid in ids:
+            del self.rows[cid]
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+
+@pytest.fixture
+def build(tmp_path, monkeypatch):
+    collection = FakeCollection()
+    embeddings = FakeEmbeddings()
+    monkeypatch.setattr(rag_rebuild, "open_collection", lambda path: collection)
+    monkeypatch.setattr(rag_rebuild, "get_embeddings", lambda: embeddings)
+    return SimpleNamespace(dir=tmp_path, collection=collection, embeddings=embeddings)
+
+
+def chunk(cid, text, version="v1"):
+    return SimpleNamespace(page_content=text, metadata={"id": cid, "source": cid.split(":")[0], "version": version})
+
+
+def test_resume_skips_checkpointed_batches(build):
+    chunks = [chunk(f"a.pdf:0:{i}", f"text {i}") for i in range(5)]
+    assert rag_rebuild.embed_pipelined(chunks, build.dir, workers=2, batch_size=2) == 5
+
+    build.embeddings.calls.clear()
+    assert rag_rebuild.embed_pipelined(chunks, build.dir, workers=2, batch_size=2) == 0
+    assert build.embeddings.calls == []
+
+
+def test_resume_reembeds_chunks_whose_source_changed(build):
+    rag_rebuild.embed_pipelined([chunk("a.pdf:0:0", "old"), chunk("b.pdf:0:0", "b")], build.dir, workers=1)
+
+    build.embeddings.calls.clear()
+    changed = [chunk("a.pdf:0:0", "new", version="v2"), chunk("b.pdf:0:0", "b")]
+    assert rag_rebuild.embed_pipelined(changed, build.dir, workers=1) == 1
+    assert build.embeddings.calls == [["new"]]
+    assert build.collection.rows["a.pdf:0:0"][1] == "new"
+
+
+def test_checkpoint_lines_with_bare_ids_are_ignored(tmp_path):
+    path = tmp_path / rag_rebuild.CHECKPOINT
+    path.write_text(json.dumps(["a.pdf:0:0"]) + "\n" + json.dumps([["b.pdf:0:0", "v1"]]) + "\n")
+    assert rag_rebuild.read_checkpoint(path) == {("b.pdf:0:0", "v1")}
+
+
+def test_prune_drops_chunks_the_build_no_longer_produces(build):
+    chunks = [chunk(f"a.pdf:0:{i}", f"text {i}") for i in range(3)]
+    rag_rebuild.embed_pipelined(chunks, build.dir, workers=1)
+
+    assert rag_rebuild.prune_build_store(build.dir, {"a.pdf:0:0"}, batch_size=2) == 2
+    assert list(build.collection.rows) == ["a.pdf:0:0"]
+
+    # a pruned chunk that comes back is embedded again, not trusted to the checkpoint
+    build.embeddings.calls.clear()
+    assert rag_rebuild.embed_pipelined(chunks, build.dir, workers=1) == 2
+
+
+def test_check_no_drop_refuses_to_lose_live_pdfs(monkeypatch):
+    monkeypatch.setattr(rag_rebuild, "get_db", lambda: None)
+    monkeypatch.setattr(rag_rebuild, "list_sources", lambda db: {"a.pdf", "gone.pdf", "upload:hw.pdf"})
+
+    rag_rebuild.check_no_drop({"a.pdf", "gone.pdf"})
+    with pytest.raises(SystemExit, match="gone.pdf"):
+        rag_rebuild.check_no_drop({"a.pdf"})
+
+
+def test_carry_over_copies_uploads_and_promotes_lost_matches(build, tmp_path, monkeypatch):
+    upload_text = "uploaded homework question about vectors"
+    live_index = SimHashIndex(tmp_path / "live_simhash.json")
+    live_index.add("upload:hw.pdf:0:0", 1)
+    live_index.link("upload:hw.pdf:0:1", "old.pdf:0:0",
+                    {"page_content": upload_text, "metadata": {"source": "upload:hw.pdf", "id": "upload:hw.pdf:0:1", "q_numbers": "2"}})
+    live_index.save()
+    live_qindex = QuestionIndex(tmp_path / "live_qindex.json")
+    live_qindex.sources = {"upload:hw.pdf": {"1": ["upload:hw.pdf:0:0"], "2": ["old.pdf:0:0"]}}
+    live_qindex.save()
+
+    stored = {
+        "ids": ["upload:hw.pdf:0:0"], "embeddings": [[1.0]], "documents": ["q1"],
+        "metadatas": [{"source": "upload:hw.pdf"}],
+    }
+    monkeypatch.setattr(rag_rebuild, "DEDUP_INDEX_PATH", live_index.path)
+    monkeypatch.setattr(rag_rebuild, "QINDEX_PATH", live_qindex.path)
+    monkeypatch.setattr(rag_rebuild, "get_db", lambda: None)
+    monkeypatch.setattr(rag_rebuild, "list_sources", lambda db: {"upload:hw.pdf", "old.pdf"})
+    monkeypatch.setattr(rag_rebuild, "iter_batches", lambda db, include, where: iter([stored]))
+    monkeypatch.setattr("app.RAG.rag_db._document",
+                        lambda text, meta: SimpleNamespace(page_content=text, metadata=meta))
+
+    index = SimHashIndex(tmp_path / "build_simhash.json")
+    qindex = QuestionIndex(tmp_path / "build_qindex.json")
+    assert rag_rebuild.carry_over_uploads(build.dir, index, qindex) == 2
+
+    assert sorted(build.collection.rows) == ["upload:hw.pdf:0:0", "upload:hw.pdf:0:1"]
+    assert build.embeddings.calls == [[upload_text]]
+    assert index.links == {} and "upload:hw.pdf:0:1" in index.hashes
+    assert qindex.sources["upload:hw.pdf"] == {"1": ["upload:hw.pdf:0:0"], "2": ["upload:hw.pdf:0:1"]}
+
+
+def test_workers_must_be_positive():
+    assert positive_int("3") == 3
+    with pytest.raises(Exception, match="at least 1"):
+        positive_int("0")